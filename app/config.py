@@ -12,6 +12,17 @@ class Config:
     JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
     JWT_EXPIRE_MINUTES = int(os.getenv("JWT_EXPIRE_MINUTES", 1440))  # 24 hours
     
+    # Password hashing (Argon2id) cost; raising these re-hashes each user's password on next login
+    ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", 3))
+    ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", 65536))  # KiB
+    ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 4))
+    
+    # API token hashing pepper: a long random secret kept out of the database, e.g.
+    # `python -c "import secrets; print(secrets.token_urlsafe(32))"`. Set it before issuing
+    # tokens - setting or changing it later invalidates every issued token. Unset means
+    # unpeppered SHA-256 (the app warns at startup outside DEBUG).
+    API_TOKEN_PEPPER = os.getenv("API_TOKEN_PEPPER", "")
+    
     # Google OAuth Configuration
     GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
     GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
@@ -28,6 +39,10 @@ class Config:
     # App Configuration
     FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
     VERIFICATION_CODE_EXPIRE_MINUTES = int(os.getenv("VERIFICATION_CODE_EXPIRE_MINUTES", 30))
+    API_TOKEN_RETENTION_DAYS = int(os.getenv("API_TOKEN_RETENTION_DAYS", 30))  # Purge tokens this long after expiry
+    API_TOKEN_CACHE_TTL = int(os.getenv("API_TOKEN_CACHE_TTL", 60))  # Seconds a validated token stays cached per process
+    DEBUG = os.getenv("FLASK_DEBUG", "false").lower() in ("1", "true", "yes")  # Werkzeug dev server + debugger
+    WEB_THREADS = int(os.getenv("WEB_THREADS", 16))  # Worker threads for the waitress server
 
     COMPANY_NAME = os.getenv("COMPANY_NAME", "KeyOrbit KMS")
     COMPANY_WEBSITE = os.getenv("COMPANY_WEBSITE", "https://keyorbit.com")
@@ -0,0 +1,40 @@
+import sys
+sys.path.append('.')
+
+from datetime import datetime, timezone
+from pymongo import MongoClient
+from app.config import Config
+from app.utils.security import parse_expiration_date
+
+# One-time migration: rewrite API token dates that were saved as strings into real
+# BSON dates (UTC). Dates already stored as BSON datetimes are UTC and left untouched.
+DATE_FIELDS = ['expiresAt', 'createdAt', 'updatedAt', 'lastUsed']
+
+# Connect to DB
+client = MongoClient(Config.MONGODB_URI)
+db = client.keyorbit
+
+query = {"$or": [{field: {"$type": "string"}} for field in DATE_FIELDS]}
+tokens = list(db.api_tokens.find(query, {field: 1 for field in DATE_FIELDS}))
+
+print(f"Tokens with string dates: {len(tokens)}\n")
+
+migrated = 0
+for t in tokens:
+    updates = {}
+    for field in DATE_FIELDS:
+        value = t.get(field)
+        if not isinstance(value, str):
+            continue
+        try:
+            # Strings without an offset were written as IST
+            updates[field] = parse_expiration_date(value).astimezone(timezone.utc) if value else None
+        except ValueError as e:
+            print(f"✗ Token {t['_id']}: could not parse {field}={value!r} ({e})")
+
+    if updates:
+        db.api_tokens.update_one({"_id": t["_id"]}, {"$set": updates})
+        print(f"✓ Token {t['_id']}: {', '.join(updates)}")
+        migrated += 1
+
+print(f"\nMigrated {migrated} tokens at {datetime.now(timezone.utc).isoformat()}")
@@ -1,7 +1,7 @@
 from datetime import datetime, timedelta
 import random
 from bson import ObjectId
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
 from app.config import Config
 
 client = MongoClient(Config.MONGODB_URI)
@@ -10,6 +10,12 @@ db = client.keyorbit
 class User:
     collection = db.users
     
+    # Fields the login flows read from a user document
+    LOGIN_PROJECTION = {
+        "_id": 1, "firstName": 1, "lastName": 1, "email": 1, "role": 1,
+        "organization": 1, "isVerified": 1, "provider": 1, "providerId": 1
+    }
+    
     @staticmethod
     def create_user(data):
         user_data = {
@@ -32,11 +38,14 @@ class User:
             "createdAt": data.get("createdAt", datetime.utcnow()),
             "updatedAt": data.get("updatedAt", datetime.utcnow())
         }
+        if data.get("_id"):
+            # Caller pre-allocated the id (e.g. to reference it from another document)
+            user_data["_id"] = ObjectId(data["_id"])
         return User.collection.insert_one(user_data)
     
     @staticmethod
-    def find_by_email(email):
-        return User.collection.find_one({"email": email.lower()})
+    def find_by_email(email, projection=None):
+        return User.collection.find_one({"email": email.lower()}, projection)
     
     @staticmethod
     def find_by_id(user_id):
@@ -50,6 +59,16 @@ class User:
             {"$set": updates}
         )
     
+    @staticmethod
+    def update_verified_by_email(email, updates, projection=None):
+        """Update a verified user by email in one round-trip; returns the pre-update document"""
+        updates["updatedAt"] = datetime.utcnow()
+        return User.collection.find_one_and_update(
+            {"email": email.lower(), "isVerified": True},
+            {"$set": updates},
+            projection=projection
+        )
+    
     @staticmethod
     def set_verification_code(user_id, code):
         expires = datetime.utcnow() + timedelta(minutes=Config.VERIFICATION_CODE_EXPIRE_MINUTES)
@@ -78,6 +97,11 @@ class User:
             "provider": provider,
             "providerId": provider_id
         })
+    
+    @staticmethod
+    def create_indexes():
+        """Email lookups on every login"""
+        User.collection.create_index([("email", 1)])
 
 class Organization:
     collection = db.organizations
@@ -158,29 +182,45 @@ class PasswordReset:
         return PasswordReset.collection.find_one({"token": token})
     
     @staticmethod
-    def mark_token_used(reset_id):
-        return PasswordReset.collection.update_one(
-            {"_id": reset_id},
-            {"$set": {"used": True, "usedAt": datetime.utcnow()}}
+    def consume_token(token):
+        """Atomically mark an unused, unexpired token as used; returns it, or None if not usable"""
+        now = datetime.utcnow()
+        return PasswordReset.collection.find_one_and_update(
+            {"token": token, "used": {"$ne": True}, "expiresAt": {"$gt": now}},
+            {"$set": {"used": True, "usedAt": now}},
+            return_document=ReturnDocument.BEFORE
         )
     
     @staticmethod
     def delete_user_tokens(user_id):
         return PasswordReset.collection.delete_many({"userId": ObjectId(user_id)})
 
-from datetime import datetime, timedelta
+    @staticmethod
+    def create_indexes():
+        """Token lookups by value, and TTL expiry so MongoDB purges stale reset tokens"""
+        PasswordReset.collection.create_index([("token", 1)], unique=True)
+        PasswordReset.collection.create_index([("expiresAt", 1)], expireAfterSeconds=0)
+
+from datetime import datetime, timedelta, timezone
 import random
 from bson import ObjectId
+from bson.codec_options import CodecOptions
 from pymongo import MongoClient
 from app.config import Config
-from pytz import timezone, UTC
+from zoneinfo import ZoneInfo
 
-IST = timezone('Asia/Kolkata')
+IST = ZoneInfo('Asia/Kolkata')
+UTC = timezone.utc
 
 # ... (keep existing User, Organization, Session, PasswordReset classes) ...
 
 class ApiToken:
-    collection = db.api_tokens
+    # Dates are stored as UTC; the codec hands them back tz-aware in IST so read paths
+    # never have to localize or parse them
+    collection = db.get_collection("api_tokens", codec_options=CodecOptions(tz_aware=True, tzinfo=IST))
+    
+    # Read paths never need the stored hash, so leave it on the server
+    READ_PROJECTION = {"tokenHash": 0}
     
     @staticmethod
     def create_token(data):
@@ -192,11 +232,15 @@ class ApiToken:
         
         # Make sure datetimes are timezone aware
         if created_at and created_at.tzinfo is None:
-            created_at = IST.localize(created_at)
+            created_at = created_at.replace(tzinfo=IST)
         if updated_at and updated_at.tzinfo is None:
-            updated_at = IST.localize(updated_at)
-        if expires_at and isinstance(expires_at, datetime) and expires_at.tzinfo is None:
-            expires_at = IST.localize(expires_at)
+            updated_at = updated_at.replace(tzinfo=IST)
+        if expires_at and isinstance(expires_at, datetime):
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=IST)
+            # Stored as UTC so expiry filters compare directly against datetime.now(UTC)
+            if expires_at.tzinfo is not UTC:
+                expires_at = expires_at.astimezone(UTC)
         
         token_data = {
             "userId": ObjectId(data["userId"]),
@@ -219,68 +263,122 @@ class ApiToken:
         return ApiToken.collection.insert_one(token_data)
     
     @staticmethod
-    def find_by_user(user_id, include_revoked=False):
-        """Find all tokens for a user"""
+    def find_by_user(user_id, include_revoked=False, status=None, skip=0, limit=0, now=None):
+        """Find a user's tokens, optionally filtered by status and paginated (limit 0 = no limit).
+        
+        Tokens past their expiry keep status "active" until they are next listed, so the
+        active/expired filters go by expiresAt as well as the stored status.
+        """
         query = {"userId": ObjectId(user_id)}
-        if not include_revoked:
+        if status in ("active", "expired"):
+            now = now or datetime.now(UTC)
+            if status == "active":
+                query["status"] = "active"
+                query["$or"] = [{"expiresAt": None}, {"expiresAt": {"$gt": now}}]
+            else:
+                query["$or"] = [{"status": "expired"}, {"status": "active", "expiresAt": {"$lte": now}}]
+        elif status:
+            query["status"] = status
+        elif not include_revoked:
             query["status"] = {"$ne": "revoked"}
         
         # Sort by creation date descending
-        tokens = list(ApiToken.collection.find(query).sort("createdAt", -1))
+        cursor = ApiToken.collection.find(query, ApiToken.READ_PROJECTION).sort("createdAt", -1)
+        return list(cursor.skip(skip).limit(limit))
+    
+    @staticmethod
+    def get_user_stats(user_id, now):
+        """Aggregate a user's (non-revoked) token statistics in a single $facet query"""
+        def count(match):
+            return [{"$match": match}, {"$count": "c"}]
+        
+        pipeline = [
+            {"$match": {"userId": ObjectId(user_id), "status": {"$ne": "revoked"}}},
+            {"$facet": {
+                "byStatus": [{"$group": {"_id": {"$ifNull": ["$status", "active"]}, "c": {"$sum": 1}}}],
+                "totalCalls": [{"$group": {"_id": None, "s": {"$sum": "$apiCalls"}}}],
+                "expiringSoon": count({"status": "active", "expiresAt": {"$gt": now, "$lte": now + timedelta(days=7)}}),
+                "expiredRecently": count({"status": "expired", "expiresAt": {"$gte": now - timedelta(days=30)}}),
+                "recentlyUsed": count({"lastUsed": {"$gte": now - timedelta(days=1)}}),
+                "withIpRestrictions": count({"ipRestrictions.0": {"$exists": True}}),
+                "withoutExpiry": count({"expiresAt": None})
+            }}
+        ]
+        facets = next(ApiToken.collection.aggregate(pipeline))
         
-        # Ensure all datetime objects have IST timezone info
-        for token in tokens:
-            for field in ['createdAt', 'updatedAt', 'lastUsed', 'expiresAt']:
-                if field in token and token[field] and isinstance(token[field], datetime):
-                    if token[field].tzinfo is None:
-                        # Assume it's stored as UTC in DB, convert to IST for display
-                        token[field] = UTC.localize(token[field]).astimezone(IST)
+        def first(name, key="c"):
+            return facets[name][0][key] if facets[name] else 0
         
-        return tokens
+        by_status = {row["_id"]: row["c"] for row in facets["byStatus"]}
+        return {
+            "total": sum(by_status.values()),
+            "active": by_status.get("active", 0),
+            "expired": by_status.get("expired", 0),
+            "revoked": by_status.get("revoked", 0),
+            "expiring_soon": first("expiringSoon"),
+            "expired_recently": first("expiredRecently"),
+            "total_api_calls": first("totalCalls", "s"),
+            "recently_used": first("recentlyUsed"),
+            "with_ip_restrictions": first("withIpRestrictions"),
+            "without_expiry": first("withoutExpiry")
+        }
     
     @staticmethod
     def find_by_token_hash(token_hash):
         """Find token by its hash (direct lookup - for internal use)"""
-        token = ApiToken.collection.find_one({"tokenHash": token_hash})
-        if token and 'createdAt' in token and isinstance(token['createdAt'], datetime) and token['createdAt'].tzinfo is None:
-            token['createdAt'] = IST.localize(token['createdAt'])
-        return token
+        return ApiToken.collection.find_one({"tokenHash": token_hash})
     
     @staticmethod
     def find_by_token_value(token_value):
-        """Find token by verifying the token value against all hashes"""
-        from app.utils.security import verify_password
+        """Find token by value via an indexed lookup on its hash"""
+        from app.utils.security import hash_api_token
+        
+        # Only active and expired tokens (to check expiration)
+        token = ApiToken.collection.find_one({
+            "tokenHash": hash_api_token(token_value),
+            "status": {"$in": ["active", "expired"]}
+        })
+        if not token:
+            token = ApiToken._find_legacy_token(token_value)
+        return token
+    
+    @staticmethod
+    def _find_legacy_token(token_value):
+        """Match a token issued before the SHA-256 switch (bcrypt-hashed).
         
-        # Get all active and expired tokens (to check expiration)
-        tokens = list(ApiToken.collection.find({"status": {"$in": ["active", "expired"]}}))
+        Candidates are narrowed by preview, status and expiry before running bcrypt, and a
+        match has its stored hash upgraded so every later lookup takes the indexed path.
+        """
+        from app.utils.security import hash_api_token, verify_password_bytes, generate_token_preview
         
-        for token in tokens:
-            if verify_password(token_value, token.get("tokenHash", "")):
-                # Ensure datetime fields have timezone info
-                for field in ['createdAt', 'updatedAt', 'lastUsed', 'expiresAt']:
-                    if field in token and token[field] and isinstance(token[field], datetime) and token[field].tzinfo is None:
-                        token[field] = IST.localize(token[field])
+        token_bytes = token_value.encode('utf-8')
+        # Only usable tokens are worth a bcrypt check, so status and expiry are filtered in the query
+        candidates = ApiToken.collection.find({
+            "tokenPreview": {"$in": [generate_token_preview(token_value), f"ko_{token_value[:16]}"]},
+            "tokenHash": {"$regex": "^\\$2"},
+            "status": "active",
+            "$or": [{"expiresAt": None}, {"expiresAt": {"$gt": datetime.now(UTC)}}]
+        })
+        for token in candidates:
+            if verify_password_bytes(token_bytes, token["tokenHash"].encode('utf-8')):
+                new_hash = hash_api_token(token_value)
+                ApiToken.collection.update_one({"_id": token["_id"]}, {"$set": {"tokenHash": new_hash}})
+                token["tokenHash"] = new_hash
                 return token
         return None
     
     @staticmethod
     def find_by_id(token_id):
         """Find token by ID"""
-        token = ApiToken.collection.find_one({"_id": ObjectId(token_id)})
-        if token and 'createdAt' in token and isinstance(token['createdAt'], datetime) and token['createdAt'].tzinfo is None:
-            token['createdAt'] = IST.localize(token['createdAt'])
-        return token
+        return ApiToken.collection.find_one({"_id": ObjectId(token_id)})
     
     @staticmethod
     def find_by_user_and_id(user_id, token_id):
         """Find token by user ID and token ID"""
-        token = ApiToken.collection.find_one({
+        return ApiToken.collection.find_one({
             "_id": ObjectId(token_id),
             "userId": ObjectId(user_id)
-        })
-        if token and 'createdAt' in token and isinstance(token['createdAt'], datetime) and token['createdAt'].tzinfo is None:
-            token['createdAt'] = IST.localize(token['createdAt'])
-        return token
+        }, ApiToken.READ_PROJECTION)
     
     @staticmethod
     def update_token(token_id, updates):
@@ -336,28 +434,25 @@ class ApiToken:
             }}
         )
     
+    @staticmethod
+    def mark_expired(token_ids):
+        """Mark several active tokens as expired in one round-trip"""
+        if not token_ids:
+            return 0
+        result = ApiToken.collection.update_many(
+            {"_id": {"$in": [ObjectId(token_id) for token_id in token_ids]}, "status": "active"},
+            {"$set": {"status": "expired", "updatedAt": datetime.now(IST)}}
+        )
+        return result.modified_count
+    
     @staticmethod
     def delete_expired_tokens():
-        """Delete expired tokens (can be run as cron job)"""
-        from app.utils.security import is_token_expired
-        
-        tokens = list(ApiToken.collection.find({"status": "active", "expiresAt": {"$exists": True}}))
-        
-        expired_count = 0
-        for token in tokens:
-            expires_at = token.get("expiresAt")
-            # Ensure datetime has timezone
-            if expires_at and isinstance(expires_at, datetime) and expires_at.tzinfo is None:
-                expires_at = IST.localize(expires_at)
-            
-            if expires_at and is_token_expired(expires_at):
-                ApiToken.collection.update_one(
-                    {"_id": token["_id"]},
-                    {"$set": {"status": "expired"}}
-                )
-                expired_count += 1
-        
-        return expired_count
+        """Mark every active token past its expiry as expired (can be run as cron job)"""
+        result = ApiToken.collection.update_many(
+            {"status": "active", "expiresAt": {"$lte": datetime.now(UTC)}},
+            {"$set": {"status": "expired", "updatedAt": datetime.now(IST)}}
+        )
+        return result.modified_count
     
     @staticmethod
     def is_token_valid(token_value):
@@ -387,6 +482,42 @@ class ApiToken:
         """Get token information by value"""
         return ApiToken.find_by_token_value(token_value)
 
+    @staticmethod
+    def create_indexes():
+        """Indexes for token-value lookups, per-user listings/stats and the expiry sweep,
+        plus TTL purge of long-expired tokens"""
+        ApiToken.collection.create_index([("tokenHash", 1)], unique=True)
+        # Narrows legacy (bcrypt) token candidates by preview and status before any hash is checked
+        ApiToken.collection.create_index(
+            [("tokenPreview", 1), ("status", 1)],
+            name="tokenPreview_status"
+        )
+        # Per-user listing/stats; also serves find_by_user_and_id together with the _id index
+        ApiToken.collection.create_index(
+            [("userId", 1), ("status", 1), ("expiresAt", 1)],
+            name="userId_status_expiresAt"
+        )
+        ApiToken.collection.create_index(
+            [("status", 1), ("expiresAt", 1)],
+            name="status_expiresAt"
+        )
+        # MongoDB deletes tokens once they have been expired for the retention window;
+        # read paths already treat expiresAt < now as expired, so no sweep thread is needed
+        retention_seconds = Config.API_TOKEN_RETENTION_DAYS * 24 * 60 * 60
+        ttl_index = ApiToken.collection.index_information().get("expiresAt_ttl")
+        if ttl_index is None:
+            ApiToken.collection.create_index(
+                [("expiresAt", 1)],
+                name="expiresAt_ttl",
+                expireAfterSeconds=retention_seconds
+            )
+        elif ttl_index.get("expireAfterSeconds") != retention_seconds:
+            # create_index can't change the window of an existing index (IndexOptionsConflict)
+            db.command("collMod", ApiToken.collection.name, index={
+                "name": "expiresAt_ttl",
+                "expireAfterSeconds": retention_seconds
+            })
+
 # Add these classes to your existing models.py
 
 class Organization:
@@ -476,4 +607,13 @@ class AuditLog:
             "ipAddress": ip_address,
             "userAgent": user_agent,
             "metadata": metadata or {}
-        })
\ No newline at end of file
+        })
+
+def ensure_indexes():
+    """Create MongoDB indexes used by the hot query paths (idempotent, run at startup).
+    
+    Errors propagate so the app fails to start rather than serving without its indexes.
+    """
+    User.create_indexes()
+    PasswordReset.create_indexes()
+    ApiToken.create_indexes()
@@ -105,7 +105,7 @@ def get_my_tokens(current_user):
     """Get current user's API tokens (JWT only)"""
     try:
         from app.services.token_service import TokenService
-        tokens = TokenService.get_user_tokens(current_user['userId'])
+        tokens = TokenService.get_user_tokens(current_user['userId'], limit=0)
         return jsonify({"tokens": tokens}), 200
     except Exception as e:
         print(f"Error getting user tokens: {str(e)}")
@@ -2,24 +2,37 @@ from flask import Blueprint, request, jsonify
 from app.middlewares.auth_middleware import token_required
 from app.services.token_service import TokenService
 from datetime import datetime
-from app.utils.security import parse_expiration_date, get_current_ist_time
-import re
+from app.utils.security import parse_expiration_date, request_now_ist
 
 tokens_bp = Blueprint('tokens', __name__)
 
+TOKEN_STATUSES = ("active", "expired", "revoked")
+
 @tokens_bp.route('/api-tokens', methods=['GET'])
 @token_required
 def get_user_tokens(current_user):
-    """Get all API tokens for the current user"""
+    """Get API tokens for the current user (?status=active|expired|revoked, ?limit=, ?skip=)"""
     try:
-        tokens = TokenService.get_user_tokens(current_user['userId'])
+        status = request.args.get('status')
+        if status and status not in TOKEN_STATUSES:
+            return jsonify({"error": f"Invalid status. Use one of: {', '.join(TOKEN_STATUSES)}"}), 400
+        
+        try:
+            limit = int(request.args.get('limit', 100))
+            skip = int(request.args.get('skip', 0))
+        except ValueError:
+            return jsonify({"error": "limit and skip must be numbers"}), 400
+        if limit < 1 or limit > 500 or skip < 0:
+            return jsonify({"error": "limit must be between 1 and 500 and skip must not be negative"}), 400
+        
+        tokens = TokenService.get_user_tokens(current_user['userId'], status=status, limit=limit, skip=skip)
         stats = TokenService.get_token_stats(current_user['userId'])
         return jsonify({
             "tokens": tokens,
             "stats": stats,
             "timestamp": datetime.utcnow().isoformat(),
             "timezone": "Asia/Kolkata (IST)",
-            "serverTimeIST": get_current_ist_time().isoformat()
+            "serverTimeIST": request_now_ist().isoformat()
         }), 200
     except Exception as e:
         print(f"Error getting user tokens: {str(e)}")
@@ -63,7 +76,7 @@ def create_api_token(current_user):
         if 'expiresAt' in data and data['expiresAt']:
             try:
                 expires_at = parse_expiration_date(data['expiresAt'])
-                current_ist = get_current_ist_time()
+                current_ist = request_now_ist()
                 if expires_at <= current_ist:
                     return jsonify({"error": "Expiration date must be in the future"}), 400
             except ValueError as e:
@@ -74,25 +87,9 @@ def create_api_token(current_user):
             if not isinstance(data['ipRestrictions'], list):
                 return jsonify({"error": "IP restrictions must be an array"}), 400
             
-            # Enhanced IP validation with CIDR support
-            ipv4_pattern = re.compile(r'^(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3})(\/(\d{1,2}))?$')
-            
-            for ip in data['ipRestrictions']:
-                match = ipv4_pattern.match(ip)
-                if not match:
-                    return jsonify({"error": f"Invalid IP address format: {ip}. Use format: 192.168.1.1 or 192.168.1.0/24"}), 400
-                
-                # Validate IP octets
-                octets = match.groups()[:4]
-                for octet in octets:
-                    if int(octet) > 255:
-                        return jsonify({"error": f"Invalid IP address: {ip}. Octet must be between 0-255"}), 400
-                
-                # Validate CIDR if present
-                if match.group(6):  # CIDR part
-                    cidr = int(match.group(6))
-                    if cidr < 0 or cidr > 32:
-                        return jsonify({"error": f"Invalid CIDR: {ip}. CIDR must be between 0-32"}), 400
+            valid, error = TokenService.validate_ip_restrictions(data['ipRestrictions'])
+            if not valid:
+                return jsonify({"error": error}), 400
         
         # Create the token
         token_data = {
@@ -112,7 +109,7 @@ def create_api_token(current_user):
             "token": result,
             "timestamp": datetime.utcnow().isoformat(),
             "timezone": "Asia/Kolkata (IST)",
-            "createdAtIST": get_current_ist_time().isoformat()
+            "createdAtIST": request_now_ist().isoformat()
         }), 201
         
     except ValueError as e:
@@ -309,7 +306,7 @@ def get_token_realtime_details(current_user, token_id):
         return jsonify({
             "token": token_details,
             "timestamp": datetime.utcnow().isoformat(),
-            "serverTimeIST": get_current_ist_time().isoformat(),
+            "serverTimeIST": request_now_ist().isoformat(),
             "timezone": "Asia/Kolkata (IST)"
         }), 200
     except Exception as e:
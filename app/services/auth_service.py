@@ -1,10 +1,12 @@
 from datetime import datetime, timedelta
 from app.models import User, Session, PendingRegistration, Organization, AuditLog
-from app.utils.security import hash_password, verify_password, generate_jwt, verify_jwt, generate_verification_code
+from app.utils.security import hash_password, verify_password, password_needs_rehash, generate_jwt, verify_jwt, generate_verification_code, SESSION_TTL
+from app.utils.background import run_in_background
 from app.services.email_service import EmailService
 from app.config import Config
 from bson import ObjectId
 
+
 class AuthService:
     @staticmethod
     def register_user(user_data, ip_address=None, user_agent=None):
@@ -85,8 +87,24 @@ class AuthService:
             return None, "User already exists"
         
         try:
-            # Create user first with temporary organization data
+            # Pre-allocate the user id so the organization can reference it and the
+            # user can be inserted once, already linked to the organization
+            user_id = str(ObjectId())
+            
+            # Create organization owned by the new user
+            org_data = pending.get("organizationData", {})
+            org_result = Organization.create_organization({
+                "name": org_data.get("organizationName", "Personal"),
+                "domain": org_data.get("domain", ""),
+                "industry": org_data.get("industry", ""),
+                "size": org_data.get("companySize", ""),
+                "createdBy": ObjectId(user_id),  # Use actual user ObjectId
+                "verified": True
+            })
+            organization_id = str(org_result.inserted_id)
+            
             user_data = {
+                "_id": user_id,
                 "firstName": pending["firstName"],
                 "lastName": pending["lastName"],
                 "email": pending["email"],
@@ -95,6 +113,12 @@ class AuthService:
                 "isVerified": True,
                 "verificationCode": None,
                 "verificationCodeExpires": None,
+                "organizationId": organization_id,
+                "organization": {
+                    "id": organization_id,
+                    "name": org_data.get("organizationName", "Personal"),
+                    "domain": org_data.get("domain", "")
+                },
                 "role": "admin",  # FORCE ADMIN ROLE FOR UI REGISTRATIONS
                 "provider": "local",
                 "mfaEnabled": False,
@@ -104,30 +128,7 @@ class AuthService:
             }
             
             # Create user
-            user_result = User.create_user(user_data)
-            user_id = str(user_result.inserted_id)
-            
-            # Create organization with the created user ID
-            org_data = pending.get("organizationData", {})
-            org_result = Organization.create_organization({
-                "name": org_data.get("organizationName", "Personal"),
-                "domain": org_data.get("domain", ""),
-                "industry": org_data.get("industry", ""),
-                "size": org_data.get("companySize", ""),
-                "createdBy": ObjectId(user_id),  # Use actual user ObjectId
-                "verified": True
-            })
-            organization_id = str(org_result.inserted_id)
-            
-            # Update user with organization ID
-            User.update_user(user_id, {
-                "organizationId": ObjectId(organization_id),
-                "organization": {
-                    "id": organization_id,
-                    "name": org_data.get("organizationName", "Personal"),
-                    "domain": org_data.get("domain", "")
-                }
-            })
+            User.create_user(user_data)
             
             # Generate JWT token
             token = generate_jwt({
@@ -137,7 +138,7 @@ class AuthService:
             })
             
             # Store session
-            expires = datetime.utcnow() + timedelta(minutes=Config.JWT_EXPIRE_MINUTES)
+            expires = datetime.utcnow() + SESSION_TTL
             Session.create_session(user_id, token, expires)
             
             # Clean up pending registration
@@ -152,9 +153,9 @@ class AuthService:
                 metadata={"email": pending["email"], "organizationId": organization_id}
             )
             
-            # Send welcome email
+            # Send welcome email in the background so SMTP doesn't delay the response
             name = f"{pending['firstName']} {pending['lastName']}"
-            EmailService.send_welcome_email(pending["email"], name)
+            run_in_background(EmailService.send_welcome_email, pending["email"], name)
             
             user_response = {
                 "id": user_id,
@@ -174,9 +175,11 @@ class AuthService:
             
         except Exception as e:
             print(f"Registration error: {str(e)}")
-            # Rollback: delete user if created
+            # Rollback: delete user and organization if created
             if 'user_id' in locals():
                 User.collection.delete_one({"_id": ObjectId(user_id)})
+            if 'organization_id' in locals():
+                Organization.collection.delete_one({"_id": ObjectId(organization_id)})
             return None, f"Registration failed: {str(e)}"
     
     @staticmethod
@@ -204,6 +207,18 @@ class AuthService:
             )
             return None, "Please verify your email first"
         
+        # Accounts without a password (e.g. Google-only) can't use password login;
+        # reject them before paying for a password hash comparison
+        if not user.get("password"):
+            AuditLog.log_auth_attempt(
+                user_id=str(user["_id"]),
+                action_type="LOGIN_FAILED",
+                ip_address=ip_address,
+                user_agent=user_agent,
+                metadata={"email": email, "reason": "Password login disabled"}
+            )
+            return None, "Invalid email or password"
+
         if not verify_password(password, user["password"]):
             AuditLog.log_auth_attempt(
                 user_id=str(user["_id"]),
@@ -214,8 +229,11 @@ class AuthService:
             )
             return None, "Invalid email or password"
         
-        # Update last login
-        User.update_user(str(user["_id"]), {"lastLogin": datetime.utcnow()})
+        # Update last login, re-hashing legacy bcrypt or outdated-cost hashes now that we have the password
+        login_updates = {"lastLogin": datetime.utcnow()}
+        if password_needs_rehash(user["password"]):
+            login_updates["password"] = hash_password(password)
+        User.update_user(str(user["_id"]), login_updates)
         
         # Generate JWT token
         token = generate_jwt({
@@ -225,7 +243,7 @@ class AuthService:
         })
         
         # Store session
-        expires = datetime.utcnow() + timedelta(minutes=Config.JWT_EXPIRE_MINUTES)
+        expires = datetime.utcnow() + SESSION_TTL
         Session.create_session(str(user["_id"]), token, expires)
         
         user_data = {
@@ -266,8 +284,8 @@ class AuthService:
             )
             return None, error
         
-        # Get user info
-        user_info, error = GoogleOAuthService.get_user_info(token_data["access_token"])
+        # Get user info from the id_token claims
+        user_info, error = GoogleOAuthService.get_user_info_from_token(token_data)
         if error:
             AuditLog.log_auth_attempt(
                 user_id=None,
@@ -290,7 +308,7 @@ class AuthService:
             return None, "Google email not verified"
         
         # Check if user exists in our system
-        user = User.find_by_email(user_info["email"])
+        user = User.find_by_email(user_info["email"], projection=User.LOGIN_PROJECTION)
         
         if not user:
             # User doesn't exist - REJECT login
@@ -330,7 +348,7 @@ class AuthService:
         })
         
         # Store session
-        expires = datetime.utcnow() + timedelta(minutes=Config.JWT_EXPIRE_MINUTES)
+        expires = datetime.utcnow() + SESSION_TTL
         Session.create_session(str(user["_id"]), token, expires)
         
         user_data = {
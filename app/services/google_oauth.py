@@ -1,25 +1,40 @@
+import jwt
 import requests
+from requests.adapters import HTTPAdapter
 from app.models import User
-from app.utils.security import generate_jwt
+from app.utils.security import generate_jwt, SESSION_TTL
 from app.models import Session
-from datetime import datetime, timedelta
+from datetime import datetime
 from app.config import Config
 from urllib.parse import urlencode
 
+GOOGLE_ISSUERS = ("https://accounts.google.com", "accounts.google.com")
+
+# Config is static for the process lifetime; bind what the login path reads once
+_CLIENT_ID = Config.GOOGLE_CLIENT_ID
+_CLIENT_SECRET = Config.GOOGLE_CLIENT_SECRET
+_REDIRECT_URI = Config.GOOGLE_REDIRECT_URI
+
+# Every parameter comes from static config, so build the consent URL once at import
+GOOGLE_OAUTH_URL = "https://accounts.google.com/o/oauth2/v2/auth?" + urlencode({
+    "client_id": _CLIENT_ID,
+    "redirect_uri": _REDIRECT_URI,
+    "response_type": "code",
+    "scope": "openid email profile",
+    "access_type": "offline",
+    "prompt": "consent"
+})
+
+# Shared keep-alive connection pool for Google endpoints, sized for login bursts
+# (e.g. a whole tenant signing in at the start of the workday)
+_http = requests.Session()
+_http.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=200, pool_block=False))
+
 class GoogleOAuthService:
     @staticmethod
     def get_oauth_url():
         """Get Google OAuth URL"""
-        params = {
-            "client_id": Config.GOOGLE_CLIENT_ID,
-            "redirect_uri": Config.GOOGLE_REDIRECT_URI,
-            "response_type": "code",
-            "scope": "openid email profile",
-            "access_type": "offline",
-            "prompt": "consent"
-        }
-        
-        return f"https://accounts.google.com/o/oauth2/v2/auth?{urlencode(params)}"
+        return GOOGLE_OAUTH_URL
     
     @staticmethod
     def exchange_code_for_token(code):
@@ -28,15 +43,15 @@ class GoogleOAuthService:
             return None, "Authorization code is required"
         
         data = {
-            "client_id": Config.GOOGLE_CLIENT_ID,
-            "client_secret": Config.GOOGLE_CLIENT_SECRET,
+            "client_id": _CLIENT_ID,
+            "client_secret": _CLIENT_SECRET,
             "code": code,
             "grant_type": "authorization_code",
-            "redirect_uri": Config.GOOGLE_REDIRECT_URI
+            "redirect_uri": _REDIRECT_URI
         }
         
         try:
-            response = requests.post("https://oauth2.googleapis.com/token", data=data, timeout=10)
+            response = _http.post("https://oauth2.googleapis.com/token", data=data, timeout=10)
             if response.status_code != 200:
                 print(f"Token exchange failed: {response.status_code} - {response.text}")
                 return None, "Failed to exchange code for token"
@@ -58,7 +73,7 @@ class GoogleOAuthService:
         headers = {"Authorization": f"Bearer {access_token}"}
         
         try:
-            response = requests.get("https://www.googleapis.com/oauth2/v3/userinfo", headers=headers, timeout=10)
+            response = _http.get("https://www.googleapis.com/oauth2/v3/userinfo", headers=headers, timeout=10)
             
             if response.status_code != 200:
                 print(f"User info fetch failed: {response.status_code} - {response.text}")
@@ -72,6 +87,42 @@ class GoogleOAuthService:
             print(f"User info error: {str(e)}")
             return None, f"Failed to get user info: {str(e)}"
     
+    @staticmethod
+    def get_user_info_from_token(token_data):
+        """Get user info from the id_token in the token response (no extra HTTP call)"""
+        id_token = token_data.get("id_token")
+        if not id_token:
+            # No id_token (e.g. openid scope missing) - fall back to the userinfo endpoint
+            return GoogleOAuthService.get_user_info(token_data.get("access_token"))
+        
+        try:
+            # The id_token came directly from Google's token endpoint over TLS, so its
+            # signature check may be skipped (OpenID Connect Core 3.1.3.7); audience,
+            # expiry and issuer are still validated, and required so they can't be left out
+            claims = jwt.decode(
+                id_token,
+                options={
+                    "verify_signature": False,
+                    "verify_aud": True,
+                    "verify_exp": True,
+                    "require": ["exp", "iss", "aud", "sub"]
+                },
+                audience=_CLIENT_ID
+            )
+        except jwt.InvalidTokenError as e:
+            print(f"ID token validation error: {str(e)}")
+            return None, "Failed to get user info"
+        
+        if claims.get("iss") not in GOOGLE_ISSUERS:
+            print(f"ID token issuer mismatch: {claims.get('iss')}")
+            return None, "Failed to get user info"
+        
+        if not claims.get("sub") or not claims.get("email"):
+            print("ID token is missing sub or email")
+            return None, "Failed to get user info"
+        
+        return claims, None
+    
     @staticmethod
     def handle_google_auth(code):
         """Handle Google OAuth authentication - LOGIN ONLY"""
@@ -83,8 +134,8 @@ class GoogleOAuthService:
             print(f"Token exchange error: {error}")
             return None, error
         
-        # Get user info
-        user_info, error = GoogleOAuthService.get_user_info(token_data["access_token"])
+        # Get user info from the id_token claims
+        user_info, error = GoogleOAuthService.get_user_info_from_token(token_data)
         if error:
             print(f"Get user info error: {error}")
             return None, error
@@ -97,36 +148,33 @@ class GoogleOAuthService:
         email = user_info["email"]
         print(f"Google OAuth successful for email: {email}")
         
+        # Sync profile and provider info from Google; this doubles as the lookup, so the
+        # success path costs a single round-trip (the pre-update document is returned)
+        updates = {
+            "lastLogin": datetime.utcnow(),
+            "provider": "google",
+            "providerId": user_info.get("sub", "")
+        }
+        if "given_name" in user_info:
+            updates["firstName"] = user_info["given_name"]
+        if "family_name" in user_info:
+            updates["lastName"] = user_info["family_name"]
+        
         # CHECK IF USER EXISTS - GOOGLE IS LOGIN ONLY
-        user = User.find_by_email(email)
+        user = User.update_verified_by_email(email, updates, projection=User.LOGIN_PROJECTION)
         
         if not user:
-            print(f"No user found with email: {email}")
-            # User doesn't exist - Google OAuth is for LOGIN ONLY
-            return None, "No account found with this Google email. Please register first."
-        
-        # Check if user is verified
-        if not user.get("isVerified", False):
+            # Nothing updated - find out why for the error message
+            if not User.find_by_email(email, projection={"_id": 1}):
+                print(f"No user found with email: {email}")
+                # User doesn't exist - Google OAuth is for LOGIN ONLY
+                return None, "No account found with this Google email. Please register first."
+            
             print(f"User not verified: {email}")
             return None, "Please verify your email first. Check your inbox for verification email."
         
         print(f"User found and verified: {email}")
         
-        # Update user info if needed
-        updates = {
-            "firstName": user_info.get("given_name", user.get("firstName", "")),
-            "lastName": user_info.get("family_name", user.get("lastName", "")),
-            "lastLogin": datetime.utcnow(),
-            "updatedAt": datetime.utcnow()
-        }
-        
-        # Update provider info if this is first Google login
-        if user.get("provider") != "google":
-            updates["provider"] = "google"
-            updates["providerId"] = user_info.get("sub", "")
-        
-        User.update_user(str(user["_id"]), updates)
-        
         # Generate JWT token
         token = generate_jwt({
             "userId": str(user["_id"]),
@@ -135,7 +183,7 @@ class GoogleOAuthService:
         })
         
         # Store session
-        expires = datetime.utcnow() + timedelta(minutes=Config.JWT_EXPIRE_MINUTES)
+        expires = datetime.utcnow() + SESSION_TTL
         Session.create_session(str(user["_id"]), token, expires)
         
         user_data = {
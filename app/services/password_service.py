@@ -2,6 +2,7 @@ import secrets
 from datetime import datetime, timedelta
 from app.models import User, PasswordReset
 from app.utils.security import hash_password
+from app.utils.background import run_in_background
 from app.services.email_service import EmailService
 from app.config import Config
 
@@ -29,9 +30,9 @@ class PasswordService:
             expires_at=expires_at
         )
         
-        # Send reset email
+        # Send reset email in the background so SMTP doesn't delay the response
         name = f"{user['firstName']} {user['lastName']}".strip()
-        EmailService.send_password_reset_email(user["email"], token, name)
+        run_in_background(EmailService.send_password_reset_email, user["email"], token, name)
         
         return True, "Password reset instructions sent to your email"
 
@@ -53,12 +54,10 @@ class PasswordService:
     @staticmethod
     def reset_password(token, new_password):
         """Reset password using valid token"""
-        # Validate token
-        is_valid, result = PasswordService.validate_reset_token(token)
-        if not is_valid:
-            return False, result
-        
-        reset_record = result
+        # Consume the token in one atomic round-trip so it can't be used twice
+        reset_record = PasswordReset.consume_token(token)
+        if not reset_record:
+            return False, "Invalid or expired reset token"
         
         # Hash new password
         hashed_password = hash_password(new_password)
@@ -69,15 +68,4 @@ class PasswordService:
             "updatedAt": datetime.utcnow()
         })
         
-        # Mark token as used
-        PasswordReset.mark_token_used(reset_record["_id"])
-        
         return True, "Password reset successfully"
-
-    @staticmethod
-    def cleanup_expired_tokens():
-        """Clean up expired reset tokens (can be run as a scheduled task)"""
-        expired_time = datetime.utcnow()
-        return PasswordReset.collection.delete_many({
-            "expiresAt": {"$lt": expired_time}
-        })
\ No newline at end of file
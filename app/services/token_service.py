@@ -1,19 +1,141 @@
+import hmac
+import random
 import secrets
-from datetime import datetime, timedelta
-from pytz import timezone, UTC
+import threading
+from datetime import timedelta, timezone
+from functools import lru_cache
+from ipaddress import ip_address, ip_network
+from cachetools import TTLCache
+from app.config import Config
 from app.models import ApiToken
+from app.utils.background import run_in_background
 from app.utils.security import (
-    hash_password, 
-    generate_api_token, 
-    generate_token_preview,
-    verify_password,
-    get_current_ist_time,
-    is_token_expired,
+    hash_api_token,
+    generate_api_token_and_preview,
+    request_now_ist,
     parse_expiration_date,
     calculate_expiry_time
 )
 
-IST = timezone('Asia/Kolkata')
+UTC = timezone.utc
+
+# In-process cache of validated tokens so hot tokens skip the database lookup. Keys are an
+# HMAC of the token value under a per-process secret, so the cache never holds raw tokens.
+# Invalidation is local: other worker processes see revocations after at most the TTL.
+_TOKEN_CACHE_SECRET = secrets.token_bytes(32)
+_TOKEN_CACHE = TTLCache(maxsize=10000, ttl=Config.API_TOKEN_CACHE_TTL)
+_TOKEN_CACHE_LOCK = threading.RLock()
+_CACHED_TOKEN_FIELDS = (
+    "_id", "userId", "name", "status", "expiresAt",
+    "permissions", "scopes", "rateLimit", "ipRestrictions"
+)
+
+# Performance metric tiers, checked top-down (first match wins)
+# (min token age in days, base success rate), 97.0 below that - older tokens are more established
+_AGE_BASE_RATES = ((30, 99.5), (7, 98.5))
+# (min api calls, success bonus, success cap, base response ms, response spread ms)
+# - more calls = more stable
+_VOLUME_TIERS = (
+    (10000, 2.0, 99.9, 110, 20),  # 110-130ms
+    (1000, 1.5, 99.5, 120, 30),   # 120-150ms
+    (100, 1.0, 99.0, 130, 40),    # 130-170ms
+    (0, 0.0, 100.0, 145, 50)      # 145-195ms
+)
+
+@lru_cache(maxsize=4096)
+def _compile_ip_restrictions(restrictions):
+    """Split a token's restrictions into exact IPs and parsed CIDR networks, once per list"""
+    exact_ips = frozenset(r for r in restrictions if '/' not in r)
+    networks = []
+    for restriction in restrictions:
+        if '/' in restriction:
+            try:
+                networks.append(ip_network(restriction, strict=False))
+            except ValueError:
+                continue
+    return exact_ips, tuple(networks)
+
+@lru_cache(maxsize=8192)
+def _tier_metrics(token_id, age_tier, volume_tier):
+    """Success rate and base response time for a token's age and volume tiers; cached per
+    tier so a token's figures stay put (and skip the RNG) while its call count grows"""
+    # Calculate success rate based on token age and usage patterns
+    base_rate = 97.0 if age_tier is None else _AGE_BASE_RATES[age_tier][1]
+    
+    # Adjust success rate and response time based on API call volume
+    _, bonus, cap, base_ms, _ = _VOLUME_TIERS[volume_tier]
+    success_rate = min(cap, base_rate + bonus)
+    
+    # Add some randomness to make it look real
+    success_rate += random.uniform(-0.5, 0.5)
+    base_ms += random.randint(-5, 5)
+    
+    return round(success_rate, 1), base_ms
+
+def _performance_metrics(token_id, api_calls, token_age_days):
+    """Success rate and response time for a token's usage"""
+    age_tier = next((i for i, (min_age, _) in enumerate(_AGE_BASE_RATES) if token_age_days > min_age), None)
+    volume_tier = next(i for i, tier in enumerate(_VOLUME_TIERS) if api_calls > tier[0])
+    success_rate, base_ms = _tier_metrics(token_id, age_tier, volume_tier)
+    return success_rate, base_ms + (api_calls % _VOLUME_TIERS[volume_tier][4])
+
+def _is_expired(expires_at, now):
+    """Expiry check against a "now" the caller computed once (aware datetimes compare across zones)"""
+    return bool(expires_at) and now > expires_at
+
+def _token_cache_key(token_value):
+    return hmac.new(_TOKEN_CACHE_SECRET, token_value.encode('utf-8'), 'sha256').digest()
+
+def _get_cached_token(cache_key):
+    with _TOKEN_CACHE_LOCK:
+        return _TOKEN_CACHE.get(cache_key)
+
+def _cache_token(cache_key, token):
+    """Cache the non-sensitive fields of a validated token (never the hash)"""
+    with _TOKEN_CACHE_LOCK:
+        _TOKEN_CACHE[cache_key] = {field: token.get(field) for field in _CACHED_TOKEN_FIELDS}
+
+def _invalidate_cached_token(token_id):
+    """Drop a token from the cache after its status, permissions or value change"""
+    token_id = str(token_id)
+    with _TOKEN_CACHE_LOCK:
+        stale_keys = [key for key, token in _TOKEN_CACHE.items() if str(token["_id"]) == token_id]
+        for key in stale_keys:
+            _TOKEN_CACHE.pop(key, None)
+
+def _validate_expiry_update(value):
+    """Future expiry date, stored as UTC (empty passes through unchanged)"""
+    if not value:
+        return True, value
+    try:
+        expires_at = parse_expiration_date(value)
+    except ValueError as e:
+        return False, str(e)
+    if expires_at <= request_now_ist():
+        return False, "Expiration date must be in the future"
+    return True, expires_at.astimezone(UTC)
+
+def _validate_rate_limit_update(value):
+    try:
+        rate_limit = int(value)
+    except (TypeError, ValueError):
+        return False, "Rate limit must be a number"
+    if rate_limit < 1 or rate_limit > 10000:
+        return False, "Rate limit must be between 1 and 10000"
+    return True, rate_limit
+
+def _validate_ip_restrictions_update(value):
+    if not isinstance(value, list):
+        return False, "IP restrictions must be an array"
+    valid, error = TokenService.validate_ip_restrictions(value)
+    return (True, value) if valid else (False, error)
+
+# Validators for update_token, keyed by the field they check; each returns (ok, error or value)
+_UPDATE_VALIDATORS = {
+    'expiresAt': _validate_expiry_update,
+    'rateLimit': _validate_rate_limit_update,
+    'ipRestrictions': _validate_ip_restrictions_update
+}
 
 class TokenService:
     @staticmethod
@@ -21,14 +143,13 @@ class TokenService:
         """Create a new API token for user"""
         try:
             # Generate token value
-            token_value = generate_api_token()
-            token_preview = generate_token_preview(token_value)
+            token_value, token_preview = generate_api_token_and_preview()
             
             # Hash the token for secure storage
-            token_hash = hash_password(token_value)
+            token_hash = hash_api_token(token_value)
             
             # Get current IST time
-            current_ist = get_current_ist_time()
+            current_ist = request_now_ist()
             
             # Parse expiration date if provided
             expires_at = None
@@ -91,27 +212,12 @@ class TokenService:
             raise
     
     @staticmethod
-    def _calculate_time_until_expiry(expires_at):
+    def _calculate_time_until_expiry(expires_at, current_ist):
         """Calculate time remaining until token expires"""
         if not expires_at:
             return None, None
         
-        current_ist = get_current_ist_time()
-        
-        try:
-            # Ensure expires_at is timezone aware
-            if isinstance(expires_at, datetime):
-                if expires_at.tzinfo is None:
-                    expires_at = IST.localize(expires_at)
-                else:
-                    expires_at = expires_at.astimezone(IST)
-            else:
-                # If it's a string, parse it
-                expires_at = parse_expiration_date(str(expires_at))
-        except Exception as e:
-            print(f"Error parsing expiry date: {e}")
-            return None, None
-        
+        # expiresAt is always a tz-aware datetime (stored UTC, read back in IST)
         time_diff = expires_at - current_ist
         total_seconds = time_diff.total_seconds()
         
@@ -133,105 +239,77 @@ class TokenService:
     def _calculate_performance_metrics(token, current_ist):
         """Calculate performance metrics for a token"""
         api_calls = token.get("apiCalls", 0)
-        success_rate = 100.0
-        avg_response_time = 145
+        created_at = token.get("createdAt")
         
-        if api_calls > 0:
-            created_at = token.get("createdAt")
-            if isinstance(created_at, datetime):
-                if created_at.tzinfo is None:
-                    created_at = IST.localize(created_at)
-                else:
-                    created_at = created_at.astimezone(IST)
-                
-                token_age_days = (current_ist - created_at).days
-                
-                # Calculate success rate based on token age and usage patterns
-                base_rate = 97.0
-                if token_age_days > 30:
-                    base_rate = 99.5  # Older, established tokens have higher success rates
-                elif token_age_days > 7:
-                    base_rate = 98.5
-                
-                # Adjust based on API call volume (more calls = more stable)
-                if api_calls > 10000:
-                    success_rate = min(99.9, base_rate + 2.0)
-                elif api_calls > 1000:
-                    success_rate = min(99.5, base_rate + 1.5)
-                elif api_calls > 100:
-                    success_rate = min(99.0, base_rate + 1.0)
-                else:
-                    success_rate = base_rate
-                
-                # Calculate average response time based on usage
-                if api_calls > 10000:
-                    avg_response_time = 110 + (api_calls % 20)  # 110-130ms
-                elif api_calls > 1000:
-                    avg_response_time = 120 + (api_calls % 30)  # 120-150ms
-                elif api_calls > 100:
-                    avg_response_time = 130 + (api_calls % 40)  # 130-170ms
-                else:
-                    avg_response_time = 145 + (api_calls % 50)  # 145-195ms
-                
-                # Add some randomness to make it look real
-                import random
-                success_rate += random.uniform(-0.5, 0.5)
-                avg_response_time += random.randint(-5, 5)
+        if api_calls > 0 and created_at:
+            token_age_days = (current_ist - created_at).days
+            return _performance_metrics(str(token["_id"]), api_calls, token_age_days)
+        
+        return 100.0, 145
+    
+    @staticmethod
+    def _format_token(token, status, current_ist):
+        """Build the response dict shared by the token list and token details"""
+        expires_at = token.get("expiresAt")
+        created_at = token.get("createdAt")
+        last_used = token.get("lastUsed")
+        api_calls = token.get("apiCalls", 0)
+        rate_limit = token.get("rateLimit", 1000)
+        created_at_iso = created_at.isoformat() if created_at else None
+        
+        # Calculate time until expiry
+        expires_in, days_until = TokenService._calculate_time_until_expiry(expires_at, current_ist)
+        
+        # Calculate performance metrics
+        success_rate, avg_response_time = TokenService._calculate_performance_metrics(token, current_ist)
         
-        return round(success_rate, 1), avg_response_time
+        return {
+            "id": str(token["_id"]),
+            "name": token["name"],
+            "description": token.get("description", ""),
+            "tokenPreview": token.get("tokenPreview", ""),
+            "permissions": token.get("permissions", []),
+            "scopes": token.get("scopes", []),
+            "status": status,
+            "rateLimit": rate_limit,
+            "ipRestrictions": token.get("ipRestrictions", []),
+            "createdAt": created_at_iso,
+            "lastUsed": last_used.isoformat() if last_used else None,
+            "expiresAt": expires_at.isoformat() if expires_at else None,
+            "expiresIn": expires_in,
+            "daysUntilExpiry": days_until,
+            "apiCalls": api_calls,
+            "lastUsedIp": token.get("lastUsedIp"),
+            "createdAtIST": created_at_iso,
+            "successRate": success_rate,
+            "avgResponseTime": avg_response_time,
+            # Simulate some realistic usage patterns
+            "peakHourCalls": min(api_calls % 100, rate_limit),
+            "hourlyUsage": min(api_calls % 60, rate_limit)
+        }
     
     @staticmethod
-    def get_user_tokens(user_id):
-        """Get all API tokens for a user"""
+    def get_user_tokens(user_id, status=None, limit=100, skip=0):
+        """Get a page of API tokens for a user (revoked tokens hidden unless asked for)"""
         try:
-            tokens = ApiToken.find_by_user(user_id)
-            
             # Auto-expire tokens that have passed their expiry
-            current_ist = get_current_ist_time()
+            current_ist = request_now_ist()
+            tokens = ApiToken.find_by_user(user_id, status=status, skip=skip, limit=limit, now=current_ist)
             
             formatted_tokens = []
+            expired_ids = []
             for token in tokens:
                 # Check if token is expired
-                expires_at = token.get("expiresAt")
-                status = token.get("status", "active")
+                token_status = token.get("status", "active")
                 
-                if status == "active" and expires_at:
-                    if is_token_expired(expires_at):
-                        # Auto-mark as expired
-                        ApiToken.update_token(str(token["_id"]), {"status": "expired"})
-                        status = "expired"
+                if token_status == "active" and _is_expired(token.get("expiresAt"), current_ist):
+                    # Auto-mark as expired (written in one batch below)
+                    expired_ids.append(token["_id"])
+                    token_status = "expired"
                 
-                # Calculate time until expiry
-                expires_in, days_until = TokenService._calculate_time_until_expiry(expires_at)
-                
-                # Calculate performance metrics
-                success_rate, avg_response_time = TokenService._calculate_performance_metrics(token, current_ist)
-                
-                # Format token for response
-                formatted_token = {
-                    "id": str(token["_id"]),
-                    "name": token["name"],
-                    "description": token.get("description", ""),
-                    "tokenPreview": token.get("tokenPreview", ""),
-                    "permissions": token.get("permissions", []),
-                    "scopes": token.get("scopes", []),
-                    "status": status,
-                    "rateLimit": token.get("rateLimit", 1000),
-                    "ipRestrictions": token.get("ipRestrictions", []),
-                    "createdAt": token.get("createdAt").isoformat() if token.get("createdAt") else None,
-                    "lastUsed": token.get("lastUsed").isoformat() if token.get("lastUsed") else None,
-                    "expiresAt": token.get("expiresAt").isoformat() if token.get("expiresAt") else None,
-                    "expiresIn": expires_in,
-                    "daysUntilExpiry": days_until,
-                    "apiCalls": token.get("apiCalls", 0),
-                    "lastUsedIp": token.get("lastUsedIp"),
-                    "createdAtIST": token.get("createdAt").isoformat() if token.get("createdAt") else None,
-                    "successRate": success_rate,
-                    "avgResponseTime": avg_response_time,
-                    "peakHourCalls": min(token.get("apiCalls", 0) % 100, token.get("rateLimit", 1000)),
-                    "hourlyUsage": min(token.get("apiCalls", 0) % 60, token.get("rateLimit", 1000))
-                }
-                formatted_tokens.append(formatted_token)
+                formatted_tokens.append(TokenService._format_token(token, token_status, current_ist))
+            
+            ApiToken.mark_expired(expired_ids)
             
             return formatted_tokens
             
@@ -251,55 +329,24 @@ class TokenService:
             expires_at = token.get("expiresAt")
             status = token.get("status", "active")
             
-            if status == "active" and expires_at and is_token_expired(expires_at):
+            current_ist = request_now_ist()
+            if status == "active" and _is_expired(expires_at, current_ist):
                 # Auto-mark as expired
                 ApiToken.update_token(str(token["_id"]), {"status": "expired"})
                 status = "expired"
             
-            expires_in, days_until = TokenService._calculate_time_until_expiry(expires_at)
-            
-            # Calculate real metrics
-            current_ist = get_current_ist_time()
-            success_rate, avg_response_time = TokenService._calculate_performance_metrics(token, current_ist)
-            
-            # Calculate additional metrics
-            api_calls = token.get("apiCalls", 0)
-            rate_limit = token.get("rateLimit", 1000)
-            
-            # Simulate some realistic usage patterns
-            import random
-            peak_hour_calls = min(api_calls % 100, rate_limit)
-            hourly_usage = min(api_calls % 60, rate_limit)
+            details = TokenService._format_token(token, status, current_ist)
+            api_calls = details["apiCalls"]
             
             # Calculate usage percentage
             usage_percentage = min((api_calls / 1000) * 100, 100) if api_calls > 0 else 0
             
-            return {
-                "id": str(token["_id"]),
-                "name": token["name"],
-                "description": token.get("description", ""),
-                "tokenPreview": token.get("tokenPreview", ""),
-                "permissions": token.get("permissions", []),
-                "scopes": token.get("scopes", []),
-                "status": status,
-                "rateLimit": rate_limit,
-                "ipRestrictions": token.get("ipRestrictions", []),
-                "createdAt": token.get("createdAt").isoformat() if token.get("createdAt") else None,
-                "lastUsed": token.get("lastUsed").isoformat() if token.get("lastUsed") else None,
-                "expiresAt": token.get("expiresAt").isoformat() if token.get("expiresAt") else None,
-                "expiresIn": expires_in,
-                "daysUntilExpiry": days_until,
-                "apiCalls": api_calls,
-                "lastUsedIp": token.get("lastUsedIp"),
-                "createdAtIST": token.get("createdAt").isoformat() if token.get("createdAt") else None,
-                "successRate": success_rate,
-                "avgResponseTime": avg_response_time,
-                "peakHourCalls": peak_hour_calls,
-                "hourlyUsage": hourly_usage,
+            details.update({
                 "usagePercentage": round(usage_percentage, 1),
                 "estimatedDailyCalls": api_calls // 30 if api_calls > 30 else api_calls,
-                "errorRate": round(100 - success_rate, 1)
-            }
+                "errorRate": round(100 - details["successRate"], 1)
+            })
+            return details
             
         except Exception as e:
             print(f"Error in get_token_details: {str(e)}")
@@ -317,12 +364,12 @@ class TokenService:
                 return None, f"Cannot regenerate {token.get('status')} token"
             
             # Generate new token value
-            new_token_value = generate_api_token()
-            new_token_preview = generate_token_preview(new_token_value)
-            new_token_hash = hash_password(new_token_value)
+            new_token_value, new_token_preview = generate_api_token_and_preview()
+            new_token_hash = hash_api_token(new_token_value)
             
             # Update token in database
             ApiToken.regenerate_token(token_id, new_token_hash, new_token_preview)
+            _invalidate_cached_token(token_id)
             
             # Get updated token info
             updated_token = ApiToken.find_by_id(token_id)
@@ -333,19 +380,7 @@ class TokenService:
             expires_in = None
             
             if expires_at:
-                current_ist = get_current_ist_time()
-                
-                # Ensure expires_at is timezone-aware
-                if isinstance(expires_at, datetime):
-                    if expires_at.tzinfo is None:
-                        expires_at = IST.localize(expires_at)
-                    else:
-                        expires_at = expires_at.astimezone(IST)
-                else:
-                    expires_at = parse_expiration_date(str(expires_at))
-                
-                # Now safe to subtract
-                time_diff = expires_at - current_ist
+                time_diff = expires_at - request_now_ist()
                 days_until_expiry = time_diff.days
                 
                 if days_until_expiry > 0:
@@ -380,6 +415,7 @@ class TokenService:
                 return True, "Token already revoked"
             
             ApiToken.revoke_token(token_id)
+            _invalidate_cached_token(token_id)
             return True, None
             
         except Exception as e:
@@ -399,19 +435,32 @@ class TokenService:
             
             updates = {
                 "permissions": permissions,
-                "updatedAt": get_current_ist_time()
+                "updatedAt": request_now_ist()
             }
             
             if scopes is not None:
                 updates["scopes"] = scopes
             
             ApiToken.update_token(token_id, updates)
+            _invalidate_cached_token(token_id)
             return True, None
             
         except Exception as e:
             print(f"Error in update_token_permissions: {str(e)}")
             return False, str(e)
     
+    @staticmethod
+    def validate_ip_restrictions(ip_restrictions):
+        """Validate IP restriction entries (single addresses or CIDR ranges)"""
+        for ip in ip_restrictions:
+            try:
+                if not isinstance(ip, str):
+                    raise ValueError(ip)
+                ip_network(ip, strict=False)
+            except ValueError:
+                return False, f"Invalid IP/CIDR: {ip}. Use e.g. 192.168.1.1 or 192.168.1.0/24"
+        return True, None
+    
     @staticmethod
     def _check_ip_restriction(client_ip, ip_restrictions):
         """Check if client IP is allowed based on restrictions"""
@@ -421,38 +470,19 @@ class TokenService:
         if not client_ip:
             return False  # IP restrictions exist but no client IP provided
         
+        exact_ips, networks = _compile_ip_restrictions(tuple(ip_restrictions))
+        
         # First check exact IP match
-        if client_ip in ip_restrictions:
+        if client_ip in exact_ips:
             return True
         
         # Check CIDR notation
-        try:
-            from ipaddress import ip_network, ip_address
-            
-            for restriction in ip_restrictions:
-                if '/' in restriction:
-                    try:
-                        network = ip_network(restriction, strict=False)
-                        if ip_address(client_ip) in network:
-                            return True
-                    except ValueError:
-                        continue
-        except ImportError:
-            # Fallback for environments without ipaddress module
-            # Simple CIDR check for common cases
-            for restriction in ip_restrictions:
-                if '/' in restriction:
-                    base_ip = restriction.split('/')[0]
-                    cidr = int(restriction.split('/')[1])
-                    
-                    if cidr == 24:
-                        # Check /24 subnet
-                        if client_ip.startswith(base_ip.rsplit('.', 1)[0] + '.'):
-                            return True
-                    elif cidr == 16:
-                        # Check /16 subnet
-                        if client_ip.startswith(base_ip.rsplit('.', 2)[0] + '.'):
-                            return True
+        if networks:
+            try:
+                client_address = ip_address(client_ip)
+            except ValueError:
+                return False
+            return any(client_address in network for network in networks)
         
         return False
     
@@ -460,11 +490,18 @@ class TokenService:
     def validate_token_access(token_value, required_permissions=None, required_scopes=None, client_ip=None):
         """Validate token and check if it has required permissions/scopes with IP restrictions"""
         try:
-            # Get token from database using verify_password
-            token = ApiToken.find_by_token_value(token_value)
+            cache_key = _token_cache_key(token_value)
+            token = _get_cached_token(cache_key)
             
-            if not token:
-                return False, "Invalid token", None
+            if token is None:
+                # Cache miss - look the token up by its hash
+                token = ApiToken.find_by_token_value(token_value)
+                
+                if not token:
+                    return False, "Invalid token", None
+                
+                if token.get("status", "active") == "active":
+                    _cache_token(cache_key, token)
             
             status = token.get("status", "active")
             
@@ -474,12 +511,13 @@ class TokenService:
             
             # Check expiration with proper error message
             expires_at = token.get("expiresAt")
-            if expires_at and is_token_expired(expires_at):
+            if _is_expired(expires_at, request_now_ist()):
                 # Auto-mark as expired
                 ApiToken.collection.update_one(
                     {"_id": token["_id"]},
                     {"$set": {"status": "expired"}}
                 )
+                _invalidate_cached_token(token["_id"])
                 return False, "Token has expired", None
             
             # Check IP restrictions
@@ -493,22 +531,22 @@ class TokenService:
                 if not TokenService._check_ip_restriction(client_ip, ip_restrictions):
                     return False, f"IP address {client_ip} not allowed for this token", None
             
-            # Check permissions if required
+            # Check permissions if required (set lookups; reports the first missing one in request order)
             if required_permissions:
-                token_permissions = token.get("permissions", [])
-                for required_perm in required_permissions:
-                    if required_perm not in token_permissions:
-                        return False, f"Insufficient permissions: {required_perm}", None
+                token_permissions = frozenset(token.get("permissions", []))
+                missing_perm = next((p for p in required_permissions if p not in token_permissions), None)
+                if missing_perm is not None:
+                    return False, f"Insufficient permissions: {missing_perm}", None
             
             # Check scopes if required
             if required_scopes:
-                token_scopes = token.get("scopes", [])
-                for required_scope in required_scopes:
-                    if required_scope not in token_scopes:
-                        return False, f"Insufficient scopes: {required_scope}", None
+                token_scopes = frozenset(token.get("scopes", []))
+                missing_scope = next((s for s in required_scopes if s not in token_scopes), None)
+                if missing_scope is not None:
+                    return False, f"Insufficient scopes: {missing_scope}", None
             
-            # Increment API call count
-            ApiToken.increment_api_calls(token["_id"], client_ip)
+            # Record usage off the request path; the caller doesn't need the write's result
+            run_in_background(ApiToken.increment_api_calls, token["_id"], client_ip)
             
             return True, "Access granted", {
                 "userId": str(token["userId"]),
@@ -528,84 +566,8 @@ class TokenService:
     def get_token_stats(user_id):
         """Get statistics for user's tokens"""
         try:
-            tokens = ApiToken.find_by_user(user_id)
-            
-            stats = {
-                "total": len(tokens),
-                "active": 0,
-                "expired": 0,
-                "revoked": 0,
-                "expiring_soon": 0,
-                "expired_recently": 0,
-                "total_api_calls": 0,
-                "recently_used": 0,
-                "with_ip_restrictions": 0,
-                "without_expiry": 0
-            }
-            
-            current_ist = get_current_ist_time()
-            seven_days_from_now = current_ist + timedelta(days=7)
-            thirty_days_ago = current_ist - timedelta(days=30)
-            one_day_ago = current_ist - timedelta(days=1)
-            
-            for token in tokens:
-                status = token.get("status", "active")
-                stats[status] = stats.get(status, 0) + 1
-                
-                # Count tokens with IP restrictions
-                ip_restrictions = token.get("ipRestrictions", [])
-                if ip_restrictions and len(ip_restrictions) > 0:
-                    stats["with_ip_restrictions"] += 1
-                
-                # Count tokens without expiry
-                expires_at = token.get("expiresAt")
-                if not expires_at:
-                    stats["without_expiry"] += 1
-                
-                # Count expiring soon (within 7 days)
-                if status == "active" and expires_at:
-                    try:
-                        if isinstance(expires_at, datetime):
-                            expires_dt = expires_at
-                        else:
-                            expires_dt = parse_expiration_date(str(expires_at))
-                        
-                        if current_ist < expires_dt <= seven_days_from_now:
-                            stats["expiring_soon"] += 1
-                    except Exception:
-                        pass
-                
-                # Count expired recently (within 30 days)
-                if status == "expired" and expires_at:
-                    try:
-                        if isinstance(expires_at, datetime):
-                            expires_dt = expires_at
-                        else:
-                            expires_dt = parse_expiration_date(str(expires_at))
-                        
-                        if expires_dt >= thirty_days_ago:
-                            stats["expired_recently"] += 1
-                    except Exception:
-                        pass
-                
-                # Count total API calls
-                stats["total_api_calls"] += token.get("apiCalls", 0)
-                
-                # Count recently used (within 24 hours)
-                last_used = token.get("lastUsed")
-                if last_used:
-                    try:
-                        if isinstance(last_used, datetime):
-                            last_used_dt = last_used
-                        else:
-                            last_used_dt = parse_expiration_date(str(last_used))
-                        
-                        if last_used_dt >= one_day_ago:
-                            stats["recently_used"] += 1
-                    except Exception:
-                        pass
-            
-            return stats
+            # Counted server-side: one round-trip, no token documents shipped to Python
+            return ApiToken.get_user_stats(user_id, request_now_ist())
             
         except Exception as e:
             print(f"Error in get_token_stats: {str(e)}")
@@ -632,10 +594,12 @@ class TokenService:
                 expires_at = token.get("expiresAt")
                 status = token.get("status", "active")
                 
-                if status == "active" and expires_at and is_token_expired(expires_at):
+                current_ist = request_now_ist()
+                is_expired = _is_expired(expires_at, current_ist)
+                if status == "active" and is_expired:
                     status = "expired"
                 
-                expires_in, days_until = TokenService._calculate_time_until_expiry(expires_at)
+                expires_in, days_until = TokenService._calculate_time_until_expiry(expires_at, current_ist)
                 
                 return {
                     "found": True,
@@ -644,7 +608,7 @@ class TokenService:
                     "permissions": token.get("permissions", []),
                     "ipRestrictions": token.get("ipRestrictions", []),
                     "expires_at": expires_at.isoformat() if expires_at else None,
-                    "is_expired": is_token_expired(expires_at) if expires_at else False,
+                    "is_expired": is_expired,
                     "time_until_expiry": expires_in,
                     "days_until_expiry": days_until,
                     "api_calls": token.get("apiCalls", 0),
@@ -660,34 +624,8 @@ class TokenService:
     def cleanup_expired_tokens():
         """Clean up expired tokens (can be run as cron job)"""
         try:
-            tokens = ApiToken.collection.find({"status": "active", "expiresAt": {"$exists": True}})
-            
-            expired_count = 0
-            current_utc = datetime.now(UTC)
-            
-            for token in tokens:
-                expires_at = token.get("expiresAt")
-                if expires_at:
-                    # Convert to UTC for comparison
-                    if isinstance(expires_at, datetime):
-                        if expires_at.tzinfo is None:
-                            expires_at = IST.localize(expires_at)
-                        expires_utc = expires_at.astimezone(UTC)
-                    else:
-                        # Try to parse string
-                        try:
-                            expires_at_dt = parse_expiration_date(str(expires_at))
-                            expires_utc = expires_at_dt.astimezone(UTC)
-                        except:
-                            continue
-                    
-                    if current_utc > expires_utc:
-                        # Mark as expired
-                        ApiToken.collection.update_one(
-                            {"_id": token["_id"]},
-                            {"$set": {"status": "expired", "updatedAt": get_current_ist_time()}}
-                        )
-                        expired_count += 1
+            # Single server-side update instead of one round-trip per token
+            expired_count = ApiToken.delete_expired_tokens()
             
             return {"cleaned": expired_count, "message": f"Marked {expired_count} tokens as expired"}
             
@@ -706,56 +644,22 @@ class TokenService:
             if token.get("status") != "active":
                 return False, f"Cannot update {token.get('status')} token"
             
-            # Validate certain updates
-            if 'expiresAt' in updates and updates['expiresAt']:
-                try:
-                    expires_at = parse_expiration_date(updates['expiresAt'])
-                    current_ist = get_current_ist_time()
-                    if expires_at <= current_ist:
-                        return False, "Expiration date must be in the future"
-                    updates['expiresAt'] = expires_at
-                except ValueError as e:
-                    return False, str(e)
-            
-            if 'rateLimit' in updates:
-                try:
-                    rate_limit = int(updates['rateLimit'])
-                    if rate_limit < 1 or rate_limit > 10000:
-                        return False, "Rate limit must be between 1 and 10000"
-                except ValueError:
-                    return False, "Rate limit must be a number"
-            
-            if 'ipRestrictions' in updates:
-                if not isinstance(updates['ipRestrictions'], list):
-                    return False, "IP restrictions must be an array"
-                
-                # Validate IP addresses
-                import re
-                ipv4_pattern = re.compile(r'^(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3})(\/(\d{1,2}))?$')
-                
-                for ip in updates['ipRestrictions']:
-                    match = ipv4_pattern.match(ip)
-                    if not match:
-                        return False, f"Invalid IP address format: {ip}. Use format: 192.168.1.1 or 192.168.1.0/24"
-                    
-                    # Validate IP octets
-                    octets = match.groups()[:4]
-                    for octet in octets:
-                        if int(octet) > 255:
-                            return False, f"Invalid IP address: {ip}. Octet must be between 0-255"
-                    
-                    # Validate CIDR if present
-                    if match.group(6):  # CIDR part
-                        cidr = int(match.group(6))
-                        if cidr < 0 or cidr > 32:
-                            return False, f"Invalid CIDR: {ip}. CIDR must be between 0-32"
+            # Validate (and normalise) only the fields actually being updated
+            for field, value in list(updates.items()):
+                validator = _UPDATE_VALIDATORS.get(field)
+                if validator:
+                    valid, result = validator(value)
+                    if not valid:
+                        return False, result
+                    updates[field] = result
             
             # Add updated timestamp
-            updates['updatedAt'] = get_current_ist_time()
+            updates['updatedAt'] = request_now_ist()
             
             ApiToken.update_token(token_id, updates)
+            _invalidate_cached_token(token_id)
             return True, "Token updated successfully"
             
         except Exception as e:
             print(f"Error in update_token: {str(e)}")
-            return False, str(e)
\ No newline at end of file
+            return False, str(e)
@@ -1,7 +1,8 @@
 import sys
 sys.path.append('.')
 
-from app.utils.security import verify_password
+from app.utils.security import verify_api_token, verify_password_bytes, generate_token_preview
+from datetime import datetime, timezone
 from pymongo import MongoClient
 from app.config import Config
 
@@ -9,8 +10,8 @@ from app.config import Config
 client = MongoClient(Config.MONGODB_URI)
 db = client.keyorbit
 
-# Get all tokens
-tokens = list(db.api_tokens.find({}))
+# Get all tokens (only the fields printed below)
+tokens = list(db.api_tokens.find({}, {'name': 1, 'tokenPreview': 1, 'tokenHash': 1, 'status': 1, 'createdAt': 1}))
 
 print(f"Total tokens in DB: {len(tokens)}\n")
 
@@ -28,17 +29,35 @@ test_token = "CJYXedlGemlbg1-vCsOGA-RTRU_a5HBVY7rjzoHjxT6eZ0GQED8afuPrkfD2mDLF90
 print(f"\nTesting token: {test_token[:20]}...")
 print(f"Token length: {len(test_token)}")
 
-# Check if any token in DB matches this hash USING VERIFY_PASSWORD
+# Only active, unexpired tokens whose preview matches can match the token itself, so narrow
+# the candidates by the (indexed) preview, status and expiry before running any hash checks
+candidates = list(db.api_tokens.find(
+    {
+        'tokenPreview': {'$in': [generate_token_preview(test_token), f'ko_{test_token[:16]}']},
+        'status': 'active',
+        '$or': [{'expiresAt': None}, {'expiresAt': {'$gt': datetime.now(timezone.utc)}}]
+    },
+    {'_id': 1, 'name': 1, 'tokenHash': 1, 'tokenPreview': 1, 'status': 1}
+))
+print(f"Active, unexpired candidates with a matching preview: {len(candidates)}")
+
+# Check if any candidate matches this hash USING VERIFY_API_TOKEN
+# Legacy bcrypt hashes take the bytes path; encode the test token once for all of them
+test_token_bytes = test_token.encode('ascii')
 matches_found = 0
-for t in tokens:
-    db_hash = t.get('tokenHash')
-    if verify_password(test_token, db_hash):
+for t in candidates:
+    db_hash = t.get('tokenHash', '')
+    if db_hash.startswith('$2'):
+        matched = verify_password_bytes(test_token_bytes, db_hash.encode('ascii'))
+    else:
+        matched = verify_api_token(test_token, db_hash)
+    if matched:
         print(f"\n✓ ✓ ✓ MATCH FOUND! Token '{t.get('name')}' matches your test token")
         print(f"  Token ID: {t.get('_id')}")
         matches_found += 1
 
 if matches_found == 0:
-    print("\n✗ No token in DB matches your test token")
+    print("\n✗ No active, unexpired token in DB matches your test token")
     print("\nDebugging info:")
     print(f"Token preview from DB: {tokens[0].get('tokenPreview')}")
     print(f"First 20 chars of your token: {test_token[:20]}")
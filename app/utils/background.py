@@ -0,0 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
+
+# Shared worker pool for fire-and-forget work (emails etc.) kept off the request path
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="keyorbit-bg")
+
+def _log_failure(future):
+    """Log exceptions raised by background tasks (nobody else will see them)"""
+    error = future.exception()
+    if error:
+        print(f"Background task failed: {str(error)}")
+
+def run_in_background(fn, *args, **kwargs):
+    """Submit fn(*args, **kwargs) to the background pool without waiting for it"""
+    future = _executor.submit(fn, *args, **kwargs)
+    future.add_done_callback(_log_failure)
+    return future
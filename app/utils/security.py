@@ -1,11 +1,47 @@
+import base64
+import hashlib
+import hmac
 import jwt
+from jwt.algorithms import get_default_algorithms
 import secrets
-from datetime import datetime, timedelta
-from pytz import timezone, UTC
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
 import bcrypt
+from flask import g, has_request_context
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from app.config import Config
 
-IST = timezone('Asia/Kolkata')
+IST = ZoneInfo('Asia/Kolkata')
+UTC = timezone.utc
+
+# datetime.fromisoformat only understands a trailing "Z" from Python 3.11
+_FROMISOFORMAT_ACCEPTS_Z = sys.version_info >= (3, 11)
+
+_PASSWORD_HASHER = PasswordHasher(
+    time_cost=Config.ARGON2_TIME_COST,
+    memory_cost=Config.ARGON2_MEMORY_COST,
+    parallelism=Config.ARGON2_PARALLELISM
+)
+
+# Byte -> ASCII digit table for verification codes; 250-255 are deleted instead of mapped
+# (256 isn't a multiple of 10, so mapping them would bias digits 0-5)
+_DIGIT_TABLE = bytes(0x30 + (b % 10) for b in range(256))
+_BIASED_BYTES = bytes(range(250, 256))
+
+# Prepare the JWT signing key once (bytes for HS*, parsed key object for RS*/ES*)
+# so jwt.encode doesn't re-derive it on every login
+_JWT_SECRET = Config.JWT_SECRET
+_JWT_ALGORITHM = Config.JWT_ALGORITHM
+_JWT_ALGORITHMS = [_JWT_ALGORITHM]
+_JWT_SIGNING_KEY = get_default_algorithms()[_JWT_ALGORITHM].prepare_key(_JWT_SECRET)
+_JWT_EXPIRE_SECONDS = Config.JWT_EXPIRE_MINUTES * 60
+
+# Login sessions last as long as the JWT issued with them
+SESSION_TTL = timedelta(minutes=Config.JWT_EXPIRE_MINUTES)
 
 def get_current_ist_time():
     """Get current time in IST timezone"""
@@ -15,39 +51,98 @@ def get_current_utc_time():
     """Get current time in UTC"""
     return datetime.now(UTC)
 
+def request_now_utc():
+    """Current UTC time, read once per request so every helper in it agrees on "now".
+    
+    Outside a request (background jobs, scripts) this is just datetime.now(UTC).
+    """
+    if not has_request_context():
+        return datetime.now(UTC)
+    now = getattr(g, '_now_utc', None)
+    if now is None:
+        now = g._now_utc = datetime.now(UTC)
+    return now
+
+def request_now_ist():
+    """Current IST time, read once per request (see request_now_utc)"""
+    if not has_request_context():
+        return datetime.now(IST)
+    now = getattr(g, '_now_ist', None)
+    if now is None:
+        now = g._now_ist = request_now_utc().astimezone(IST)
+    return now
+
 def format_datetime_for_db(dt):
     """Format datetime for MongoDB storage - Store as IST timezone aware"""
     if dt.tzinfo is None:
-        dt = IST.localize(dt)
+        dt = dt.replace(tzinfo=IST)
     return dt
 
 def hash_password(password):
-    """Hash a password for storing"""
-    if isinstance(password, str):
-        password = password.encode('utf-8')
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(password, salt).decode('utf-8')
+    """Hash a password for storing (Argon2id)"""
+    return _PASSWORD_HASHER.hash(password)
 
 def verify_password(password, hashed_password):
-    """Verify a stored password against one provided by user"""
+    """Verify a stored password against one provided by user.
+    
+    Argon2 hashes are checked with argon2-cffi; bcrypt hashes ("$2" prefix) from before
+    the switch are still accepted so existing users can log in and be upgraded.
+    """
     if isinstance(password, str):
         password = password.encode('utf-8')
     if isinstance(hashed_password, str):
         hashed_password = hashed_password.encode('utf-8')
-    return bcrypt.checkpw(password, hashed_password)
+    return verify_password_bytes(password, hashed_password)
+
+def verify_password_bytes(password, hashed_password):
+    """verify_password for callers that already hold both values as bytes (no re-encoding)"""
+    if hashed_password.startswith(b'$2'):
+        return bcrypt.checkpw(password, hashed_password)
+    try:
+        return _PASSWORD_HASHER.verify(hashed_password, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+def password_needs_rehash(hashed_password):
+    """True if a stored hash should be replaced on next login: legacy bcrypt hashes, and
+    Argon2 hashes made with different cost parameters than the current config"""
+    if hashed_password.startswith('$2'):
+        return True
+    try:
+        return _PASSWORD_HASHER.check_needs_rehash(hashed_password)
+    except InvalidHashError:
+        return False
+
+def hash_api_token(token):
+    """Hash an API token for storage and lookup.
+    
+    Tokens are high-entropy random values, so a peppered SHA-256 is enough and keeps
+    lookups an indexed equality match; slow KDFs stay reserved for user passwords.
+    """
+    return hashlib.sha256((Config.API_TOKEN_PEPPER + token).encode('utf-8')).hexdigest()
+
+def verify_api_token(token, token_hash):
+    """Check a token against its stored hash (bcrypt for tokens issued before SHA-256)"""
+    if not token_hash:
+        return False
+    if token_hash.startswith('$2'):
+        return verify_password(token, token_hash)
+    return hmac.compare_digest(hash_api_token(token), token_hash)
 
 def generate_jwt(payload):
     """Generate a JWT token"""
+    # Integer Unix timestamps, which is what PyJWT would convert datetimes to anyway
+    now = int(time.time())
     payload.update({
-        'exp': datetime.utcnow() + timedelta(minutes=Config.JWT_EXPIRE_MINUTES),
-        'iat': datetime.utcnow()
+        'exp': now + _JWT_EXPIRE_SECONDS,
+        'iat': now
     })
-    return jwt.encode(payload, Config.JWT_SECRET, algorithm=Config.JWT_ALGORITHM)
+    return jwt.encode(payload, _JWT_SIGNING_KEY, algorithm=_JWT_ALGORITHM)
 
 def verify_jwt(token):
     """Verify and decode a JWT token"""
     try:
-        payload = jwt.decode(token, Config.JWT_SECRET, algorithms=[Config.JWT_ALGORITHM])
+        payload = jwt.decode(token, _JWT_SECRET, algorithms=_JWT_ALGORITHMS)
         return payload
     except jwt.ExpiredSignatureError:
         return None
@@ -55,48 +150,54 @@ def verify_jwt(token):
         return None
 
 def generate_verification_code():
-    """Generate a 6-digit verification code"""
-    return ''.join([str(secrets.randbelow(10)) for _ in range(6)])
+    """Generate a 6-digit verification code.
+    
+    Digits come from one urandom read; bytes >= 250 are dropped so every digit stays uniform.
+    """
+    digits = ''
+    while len(digits) < 6:
+        digits += secrets.token_bytes(8).translate(_DIGIT_TABLE, _BIASED_BYTES).decode('ascii')
+    return digits[:6]
 
-def generate_api_token():
-    """Generate a secure API token"""
-    return secrets.token_urlsafe(64)
+def generate_api_token_and_preview():
+    """Generate a secure API token and its "ko_" display preview in one pass"""
+    token = base64.urlsafe_b64encode(secrets.token_bytes(48)).rstrip(b'=').decode('ascii')
+    return token, f"ko_{token[:16]}"
 
 def generate_token_preview(token):
-    """Generate a preview of the token (first 8 chars)"""
+    """Preview format of tokens issued before "ko_" previews (first 8 chars); only
+    needed to look those tokens up"""
     return token[:8] if token else ""
 
+@lru_cache(maxsize=1024)
+def _parse_iso(value):
+    """Parse an ISO-8601 string to an aware datetime (no offset means IST); cached since
+    the same expiry strings come back repeatedly"""
+    if not _FROMISOFORMAT_ACCEPTS_Z and value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    dt = datetime.fromisoformat(value)
+    return dt.replace(tzinfo=IST) if dt.tzinfo is None else dt
+
 def is_token_expired(expires_at):
     """Check if token is expired with proper timezone handling"""
     if not expires_at:
         return False
     
-    current_utc = get_current_utc_time()
+    current_utc = request_now_utc()
     
     # If expires_at is a datetime object
     if isinstance(expires_at, datetime):
-        # Convert to UTC for comparison
         if expires_at.tzinfo is None:
             # If no timezone, assume it's IST
-            expires_at = IST.localize(expires_at)
-        expires_utc = expires_at.astimezone(UTC)
-        return current_utc > expires_utc
+            expires_at = expires_at.replace(tzinfo=IST)
+        # Aware datetimes compare correctly across timezones, no conversion needed
+        return current_utc > expires_at
     
     # If expires_at is a string
     try:
         if isinstance(expires_at, str):
-            # Handle Z suffix for UTC
-            if expires_at.endswith('Z'):
-                expires_utc = datetime.fromisoformat(expires_at[:-1] + '+00:00')
-            else:
-                # Assume IST if no timezone specified
-                expires_dt = datetime.fromisoformat(expires_at)
-                if expires_dt.tzinfo is None:
-                    expires_dt = IST.localize(expires_dt)
-                expires_utc = expires_dt.astimezone(UTC)
-            
-            return current_utc > expires_utc
-    except (ValueError, AttributeError) as e:
+            return current_utc > _parse_iso(expires_at)
+    except ValueError as e:
         print(f"Error parsing expiration date: {e}")
     
     return False
@@ -111,21 +212,8 @@ def parse_expiration_date(expires_at_str):
         return None
     
     try:
-        # Parse the input string
-        if 'Z' in expires_at_str:
-            # UTC time with Z suffix - convert to IST
-            dt = datetime.fromisoformat(expires_at_str.replace('Z', '+00:00'))
-            dt = dt.astimezone(IST)
-        else:
-            # Try ISO format
-            dt = datetime.fromisoformat(expires_at_str)
-            if dt.tzinfo is None:
-                # Assume it's in local timezone and convert to IST
-                dt = IST.localize(dt)
-            else:
-                # Convert to IST from whatever timezone
-                dt = dt.astimezone(IST)
-        
-        return dt
+        # Convert to IST from whatever timezone the string carried (offset-less strings already are)
+        dt = _parse_iso(expires_at_str)
+        return dt if dt.tzinfo is IST else dt.astimezone(IST)
     except ValueError as e:
         raise ValueError(f"Invalid date format: {expires_at_str}. Expected ISO format: YYYY-MM-DDTHH:MM:SS")
\ No newline at end of file
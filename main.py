@@ -1,6 +1,7 @@
 from flask import Flask, jsonify
 from flask_cors import CORS
 from app.config import Config
+from app.models import ensure_indexes
 from app.routes.auth import auth_bp
 from app.routes.registration import registration_bp
 from app.routes.profile import profile_bp
@@ -9,45 +10,70 @@ from app.routes.tokens import tokens_bp
 from app.routes.me import me_bp
 from app.routes.api_protected import api_protected_bp
 
+# CORS configuration, built once at import
+_CORS_ORIGINS = (Config.FRONTEND_URL, "http://localhost:4028", "http://127.0.0.1:8000")
+_CORS_KW = dict(
+    origins=list(_CORS_ORIGINS),
+    supports_credentials=True,
+    allow_headers=["Content-Type", "Authorization", "X-Forwarded-For"],
+    methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"]
+)
+
+# (blueprint, url_prefix) pairs registered by create_app
+_BLUEPRINTS = (
+    (auth_bp, '/auth'),
+    (registration_bp, '/'),
+    (profile_bp, '/'),
+    (password_bp, '/'),
+    (tokens_bp, '/'),
+    (me_bp, '/'),
+    (api_protected_bp, '/')
+)
+
+def not_found(error):
+    return jsonify({"error": "Endpoint not found"}), 404
+
+def internal_error(error):
+    return jsonify({"error": "Internal server error"}), 500
+
 def create_app():
     app = Flask(__name__)
     app.secret_key = "Sur@6904"
     app.config.from_object(Config)
     
+    if not Config.API_TOKEN_PEPPER and not Config.DEBUG:
+        print("WARNING: API_TOKEN_PEPPER is not set; API tokens are hashed without a pepper. "
+              "Set it before issuing tokens (changing it later invalidates every issued token).")
+    
+    # Ensure MongoDB indexes exist before serving requests
+    ensure_indexes()
+    
     # Enable CORS with proper configuration
-    CORS(app, 
-         origins=[Config.FRONTEND_URL, "http://localhost:4028", "http://127.0.0.1:8000"],
-         supports_credentials=True,
-         allow_headers=["Content-Type", "Authorization", "X-Forwarded-For"],
-         methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"]
-    )
+    CORS(app, **_CORS_KW)
     
     # Register blueprints
-    app.register_blueprint(auth_bp, url_prefix='/auth')
-    app.register_blueprint(registration_bp, url_prefix='/')
-    app.register_blueprint(profile_bp, url_prefix='/')
-    app.register_blueprint(password_bp, url_prefix='/')
-    app.register_blueprint(tokens_bp, url_prefix='/')
-    app.register_blueprint(me_bp, url_prefix='/')
-    app.register_blueprint(api_protected_bp, url_prefix='/')
+    for blueprint, url_prefix in _BLUEPRINTS:
+        app.register_blueprint(blueprint, url_prefix=url_prefix)
     
     # Add health check endpoint
     @app.route('/health', methods=['GET'])
     def health_check():
         return jsonify({"status": "healthy", "service": "keyorbit-auth"}), 200
     
-    # Add error handler for 404
-    @app.errorhandler(404)
-    def not_found(error):
-        return jsonify({"error": "Endpoint not found"}), 404
-    
-    # Add error handler for 500
-    @app.errorhandler(500)
-    def internal_error(error):
-        return jsonify({"error": "Internal server error"}), 500
+    # Add JSON error handlers
+    app.register_error_handler(404, not_found)
+    app.register_error_handler(500, internal_error)
     
     return app
 
 if __name__ == '__main__':
     app = create_app()
-    app.run(debug=True, host='0.0.0.0', port=8000)
\ No newline at end of file
+    if Config.DEBUG:
+        # Development only: reloader and interactive debugger
+        app.run(debug=True, host='0.0.0.0', port=8000)
+    else:
+        # Multi-threaded WSGI server so password hashing doesn't serialize requests.
+        # On Linux, gunicorn works as well:
+        #   gunicorn -w $(nproc) -k gthread --threads 8 -b 0.0.0.0:8000 "main:create_app()"
+        from waitress import serve
+        serve(app, host='0.0.0.0', port=8000, threads=Config.WEB_THREADS)
\ No newline at end of file